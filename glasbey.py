@@ -3,14 +3,62 @@
 
 import os
 import sys
-import ast
 import argparse
+from multiprocessing import Pool
 
 import numpy as np
 from colorspacious import cspace_convert
 
 from view_palette import palette_to_image
 
+try:
+    from scipy.spatial import cKDTree
+
+except ImportError:
+    cKDTree = None
+
+try:
+    from numba import njit, prange, get_num_threads
+
+except ImportError:
+    njit = None
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True)
+    def _update_distances_jit(colors, distances, color):
+        """
+        Fused minimum-squared-distance update: one pass over memory instead of
+        the separate subtract/square/sum/minimum passes NumPy would make.
+
+        The index of the maximum updated distance is tracked per thread chunk
+        and reduced at the end, so no separate argmax sweep is needed.
+        """
+        n = colors.shape[0]
+        chunks = get_num_threads()
+        chunk = (n + chunks - 1) // chunks
+        best = np.empty(chunks, dtype=np.int64)
+        best_d = np.empty(chunks, dtype=np.float32)
+        for c in prange(chunks):
+            b = 0
+            bd = np.float32(-1.0)
+            for i in range(c * chunk, min((c + 1) * chunk, n)):
+                dx = colors[i, 0] - color[0]
+                dy = colors[i, 1] - color[1]
+                dz = colors[i, 2] - color[2]
+                d = dx * dx + dy * dy + dz * dz
+                if d < distances[i]:
+                    distances[i] = d
+                if distances[i] > bd:
+                    bd = distances[i]
+                    b = i
+            best[c] = b
+            best_d[c] = bd
+        return best[np.argmax(best_d)]
+
+else:
+    _update_distances_jit = None
+
 try:
     from progressbar import Bar, ETA, Percentage, ProgressBar
 
@@ -42,6 +90,41 @@ except ImportError:
             pass
 
 
+def _squared_distances(colors, colors_sq, color):
+    """
+    Squared Euclidean distances from every row of colors to the given color,
+    via the ||a-b||² = ||a||² + ||b||² - 2a·b identity (one BLAS dot, no
+    (N, 3) temporary). colors_sq holds the precomputed per-row squared norms.
+    """
+    return colors_sq - 2.0 * colors.dot(color) + color.dot(color)
+
+
+def _parse_range(value):
+    """
+    Parse a "lo,hi" command line argument into a tuple of floats.
+    """
+    lo, hi = value.split(",")
+    return float(lo), float(hi)
+
+
+def _convert_color_slab(args):
+    """
+    Convert one slab of the RGB cube (R components in [r0, r1)) to CAM02-UCS
+    and write it, quantized, into the memory-mapped lookup table.
+
+    Runs in a worker process; each worker maps its own view of the table file
+    and writes to a disjoint slice.
+    """
+    lut_path, scale, max_, r0, r1 = args
+    lut = np.load(lut_path, mmap_mode="r+")
+    c = np.arange(max_)
+    rgb = np.stack(np.meshgrid(np.arange(r0, r1), c, c, indexing="ij"), axis=-1)
+    rgb = rgb.reshape(-1, 3).astype(np.float64)
+    colors = cspace_convert(rgb, "sRGB255", "CAM02-UCS")
+    lut[r0 * max_ * max_:r1 * max_ * max_] = np.round(colors * scale).astype(np.int16)
+    lut.flush()
+
+
 class Glasbey:
     def __init__(self,
                  base_palette=None,
@@ -49,11 +132,29 @@ class Glasbey:
                  no_black: bool = False,
                  lightness_range=None,
                  chroma_range=None,
-                 hue_range=None):
+                 hue_range=None,
+                 boundary_only: bool = False):
         # Constants
         self.MAX = 256
         self.NUM_COLORS = self.MAX * self.MAX * self.MAX
-        self.LUT = os.path.dirname(os.path.realpath(__file__)) + "/rgb_cam02ucs_lut.npz"
+        self.LUT = os.path.dirname(os.path.realpath(__file__)) + "/rgb_cam02ucs_lut.npy"
+        # J', a', and b' all lie within [-100, 100] for the sRGB gamut, so the
+        # lookup table is stored quantized to int16 with this fixed scale. The
+        # quantization step (~0.003) is orders of magnitude below a perceptible
+        # color difference and shrinks the table 4x compared to float64.
+        self.LUT_SCALE = 32767.0 / 100.0
+        # Squared radius below which updating distances through a k-d tree ball
+        # query is cheaper than a full pass over all colors
+        self.MAX_BALL_QUERY_RADIUS_SQ = 20.0 ** 2
+
+        # Spatial index over self.colors, built lazily during palette generation
+        self._color_tree = None
+        # Cached state from the previous generate_palette call, so that growing
+        # an already generated palette resumes the greedy loop instead of
+        # recomputing all distances from scratch
+        self._colors_sq = None
+        self._distances = None
+        self._max_distance = np.inf
 
         self.overwrite_base_palette = overwrite_base_palette
 
@@ -69,41 +170,49 @@ class Glasbey:
         # Load colors
         self.colors = self.load_or_generate_color_table()
 
-        # Initialize base palette
+        # Initialize base palette, stored as a (K, 3) array of CAM02-UCS colors
         if type(base_palette) == str:
             self.base_palette = base_palette
-            self.palette = self.load_palette(base_palette)
-            self.palette = [self.colors[i, :] for i in self.palette]
+            self.palette = self.colors[self.load_palette(base_palette), :]
         elif type(base_palette) == list and len(base_palette) > 0:
-            self.palette = [(rgb[0] * 256 + rgb[1]) * 256 + rgb[2] for rgb in base_palette]
-            self.palette = [self.colors[i, :] for i in self.palette]
+            indices = [(rgb[0] * 256 + rgb[1]) * 256 + rgb[2] for rgb in base_palette]
+            self.palette = self.colors[indices, :]
         else:
-            self.palette = [self.colors[-1, :]]  # white
+            self.palette = self.colors[-1:, :]  # white
 
         assert self.check_validity_internal_palette(), "Internal error during __init__: self.palette is poorly formatted."
 
         # Update self.colors
+        # Optionally restrict candidates to the surface of the RGB cube.
+        # Maximally distant colors lie overwhelmingly on the gamut boundary, and
+        # the surface has ~400k colors instead of ~16.7M, so every subsequent
+        # filter and palette iteration gets ~40x cheaper.
+        if boundary_only:
+            index = np.arange(self.NUM_COLORS, dtype=np.uint32)
+            r, g, b = index >> 16, (index >> 8) & 0xFF, index & 0xFF
+            on_boundary = (
+                (r == 0) | (r == self.MAX - 1) |
+                (g == 0) | (g == self.MAX - 1) |
+                (b == 0) | (b == self.MAX - 1)
+            )
+            self.colors = self.colors[on_boundary, :]
         # Exclude greys (values with low Chroma in JCh) and set lightness range,
-        if lightness_range is not None:
+        # The JCh representation is computed once and the range conditions are
+        # combined into a single mask, so self.colors is converted and indexed
+        # only once no matter how many ranges are given.
+        if lightness_range is not None or chroma_range is not None or hue_range is not None:
             jch = cspace_convert(self.colors, "CAM02-UCS", "JCh")
-            self.colors = self.colors[
-                          (jch[:, 0] >= lightness_range[0]) & (jch[:, 0] <= lightness_range[1]), :
-                          ]
-        if chroma_range is not None:
-            jch = cspace_convert(self.colors, "CAM02-UCS", "JCh")
-            self.colors = self.colors[
-                          (jch[:, 1] >= chroma_range[0]) & (jch[:, 1] <= chroma_range[1]), :
-                          ]
-        if hue_range is not None:
-            jch = cspace_convert(self.colors, "CAM02-UCS", "JCh")
-            if hue_range[0] > hue_range[1]:
-                self.colors = self.colors[
-                              (jch[:, 2] >= hue_range[0]) | (jch[:, 2] <= hue_range[1]), :
-                              ]
-            else:
-                self.colors = self.colors[
-                              (jch[:, 2] >= hue_range[0]) & (jch[:, 2] <= hue_range[1]), :
-                              ]
+            mask = np.ones(len(self.colors), dtype=bool)
+            if lightness_range is not None:
+                mask &= (jch[:, 0] >= lightness_range[0]) & (jch[:, 0] <= lightness_range[1])
+            if chroma_range is not None:
+                mask &= (jch[:, 1] >= chroma_range[0]) & (jch[:, 1] <= chroma_range[1])
+            if hue_range is not None:
+                if hue_range[0] > hue_range[1]:
+                    mask &= (jch[:, 2] >= hue_range[0]) | (jch[:, 2] <= hue_range[1])
+                else:
+                    mask &= (jch[:, 2] >= hue_range[0]) & (jch[:, 2] <= hue_range[1])
+            self.colors = self.colors[mask, :]
         # Exclude colors that are close to black
         if no_black:
             MIN_DISTANCE_TO_BLACK = 35
@@ -119,28 +228,87 @@ class Glasbey:
         if size <= len(self.palette):
             return cspace_convert(self.palette[0:size], "CAM02-UCS", "sRGB1")
 
-        # Initialize distances array
         num_colors = self.colors.shape[0]
-        distances = np.ones(shape=(num_colors, 1)) * 1000
 
-        # A function to recompute minimum distances from palette to all colors
+        # Squared norms of all colors, precomputed for the ||a-b||² expansion
+        if self._colors_sq is None:
+            self._colors_sq = np.einsum("ij,ij->i", self.colors, self.colors)
+        colors_sq = self._colors_sq
+
+        # A function to recompute minimum squared distances from palette to all
+        # colors, returning the index of the farthest color. Only the argmax of
+        # the minimum is ever needed, so the sqrt is skipped everywhere.
         def update_distances(colors, color):
-            d = np.linalg.norm((colors - color), axis=1)
-            np.minimum(distances, d.reshape(distances.shape), distances)
+            if _update_distances_jit is not None:
+                return _update_distances_jit(colors, distances, color)
+            np.minimum(distances, _squared_distances(colors, colors_sq, color), out=distances)
+            return np.argmax(distances)
+
+        # A variant that touches only colors within the given squared radius of
+        # the new palette color. Stored minima can only decrease for colors that
+        # are closer to the new color than the current maximum distance, so a
+        # ball query on a k-d tree finds every color that may need an update.
+        def update_distances_in_ball(color, radius_sq):
+            if self._color_tree is None:
+                self._color_tree = cKDTree(self.colors)
+            candidates = np.asarray(
+                self._color_tree.query_ball_point(color, np.sqrt(radius_sq)),
+                dtype=np.intp,
+            )
+            d = _squared_distances(self.colors[candidates], colors_sq[candidates], color)
+            distances[candidates] = np.minimum(distances[candidates], d)
 
         # Build progress bar
         widgets = ["Generating palette: ", Percentage(), " ", Bar(), " ", ETA()]
         pbar = ProgressBar(widgets=widgets, maxval=size).start()
-        # Update distances for the colors that are already in the palette
-        for i in range(len(self.palette) - 1):
-            update_distances(self.colors, self.palette[i])
-            pbar.update(i)
+        # Update distances for the colors that are already in the palette, all
+        # at once through the ||a||² + ||b||² - 2a·bᵀ identity: one BLAS matrix
+        # product per row block instead of one full pass per palette color.
+        # Blocking keeps the (block, K) temporary bounded for large palettes.
+        # The palette is grown in a preallocated (size, 3) array; count tracks
+        # how many rows are filled.
+        count = len(self.palette)
+        palette = np.empty((size, 3), dtype=self.colors.dtype)
+        palette[:count] = self.palette
+        if self._distances is not None:
+            # Distances cached by the previous call cover every palette color
+            # except the last appended one — exactly the state the extension
+            # loop below expects — so seeding is skipped entirely.
+            distances = self._distances
+            max_distance = self._max_distance
+        else:
+            distances = np.full(num_colors, np.inf, dtype=np.float32)
+            max_distance = np.inf
+            seed = palette[:count - 1]
+            if seed.size:
+                palette_sq = np.einsum("ij,ij->i", seed, seed)
+                block = 1 << 20
+                for start in range(0, num_colors, block):
+                    stop = min(start + block, num_colors)
+                    d = (
+                        colors_sq[start:stop, None]
+                        - 2.0 * self.colors[start:stop].dot(seed.T)
+                        + palette_sq
+                    )
+                    np.minimum(
+                        distances[start:stop], d.min(axis=1), out=distances[start:stop]
+                    )
+                pbar.update(count - 1)
         # Iteratively build palette
-        while len(self.palette) < size:
-            update_distances(self.colors, self.palette[-1])
-            self.palette.append(self.colors[np.argmax(distances), :])
-            pbar.update(len(self.palette))
+        while count < size:
+            if cKDTree is not None and max_distance <= self.MAX_BALL_QUERY_RADIUS_SQ:
+                update_distances_in_ball(palette[count - 1], max_distance)
+                best = np.argmax(distances)
+            else:
+                best = update_distances(self.colors, palette[count - 1])
+            max_distance = distances[best]
+            palette[count] = self.colors[best, :]
+            count += 1
+            pbar.update(count)
         pbar.finish()
+        self.palette = palette
+        self._distances = distances
+        self._max_distance = max_distance
 
         assert self.check_validity_internal_palette(), "Internal error during extend_palette: self.palette is poorly formatted."
 
@@ -149,56 +317,76 @@ class Glasbey:
 
         return cspace_convert(self.palette[0:size], "CAM02-UCS", "sRGB1")
 
+    def get_palettes(self, sizes):
+        """
+        Return palettes of the requested sizes as a dict mapping each size to a
+        palette in sRGB1 format.
+
+        The greedy selection is prefix-monotone, so it is run once for the
+        largest size and the smaller palettes are prefixes of the result.
+        Prefer this over calling generate_palette in a loop when palettes of
+        several sizes are needed.
+        """
+        full = self.generate_palette(size=max(sizes))
+        return {size: full[:size] for size in sizes}
+
     def load_or_generate_color_table(self):
         # Load or generate RGB to CAM02-UCS color lookup table
         try:
-            colors = np.load(self.LUT)["lut"]
+            # Memory-mapped load: no decompression, pages are read on demand
+            lut = np.load(self.LUT, mmap_mode="r")
             # Sanity check
-            assert colors.shape == (self.NUM_COLORS, 3)
+            assert lut.shape == (self.NUM_COLORS, 3) and lut.dtype == np.int16
         except:
-            colors = self.generate_color_table()
-            np.savez_compressed(self.LUT, lut=colors)
-        return colors
+            self.generate_color_table()
+            lut = np.load(self.LUT, mmap_mode="r")
+        # float32 is plenty for perceptual distances and halves memory traffic
+        return lut.astype(np.float32) / np.float32(self.LUT_SCALE)
 
     def generate_color_table(self):
         """
         Generate a lookup table with all possible RGB colors, encoded in
-        perceptually uniform CAM02-UCS color space.
+        perceptually uniform CAM02-UCS color space, and write it to self.LUT.
 
         Table rows correspond to individual RGB colors, columns correspond to J',
-        a', and b' components. The table is stored as a NumPy array.
+        a', and b' components. The table is quantized with self.LUT_SCALE and
+        stored as an int16 NumPy array.
         """
-
         widgets = ["Generating color table: ", Percentage(), " ", Bar(), " ", ETA()]
-        pbar = ProgressBar(widgets=widgets, maxval=(self.MAX * self.MAX)).start()
-
-        i = 0
-        colors = np.empty(shape=(self.NUM_COLORS, 3), dtype=float)
-        for r in range(self.MAX):
-            for g in range(self.MAX):
-                d = i * self.MAX
-                for b in range(self.MAX):
-                    colors[d + b, :] = (r, g, b)
-                colors[d:d + self.MAX] = cspace_convert(
-                    colors[d:d + self.MAX], "sRGB255", "CAM02-UCS"
-                )
-                pbar.update(i)
-                i += 1
+
+        # The RGB cube is split into slabs along the R axis that a pool of
+        # worker processes converts in parallel, writing straight into a shared
+        # memory-mapped array. The file is renamed into place only once it is
+        # complete, so an interrupted run cannot leave a plausible-looking but
+        # partial table behind.
+        tmp = self.LUT + ".tmp"
+        lut = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=np.int16, shape=(self.NUM_COLORS, 3)
+        )
+        del lut  # workers map their own views of the file
+        step = 4
+        slabs = [
+            (tmp, self.LUT_SCALE, self.MAX, r, min(r + step, self.MAX))
+            for r in range(0, self.MAX, step)
+        ]
+        pbar = ProgressBar(widgets=widgets, maxval=len(slabs)).start()
+        with Pool() as pool:
+            for i, _ in enumerate(pool.imap_unordered(_convert_color_slab, slabs)):
+                pbar.update(i + 1)
         pbar.finish()
-        return colors
+        os.replace(tmp, self.LUT)
 
     @staticmethod
     def load_palette(path):
         """
         Expected format: sRGB255
         """
-        assert os.path.isfile(path)
-        palette = list()
-        with open(path, 'r') as file:
-            for line in file:
-                rgb = [int(c) for c in line.strip().split(",")]
-                palette.append((rgb[0] * 256 + rgb[1]) * 256 + rgb[2])
-        return palette
+        # Let the open perform the existence check instead of a separate stat
+        try:
+            rgb = np.loadtxt(path, delimiter=",", dtype=np.int64).reshape(-1, 3)
+        except OSError as error:
+            raise AssertionError("cannot read palette file: {}".format(path)) from error
+        return ((rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]).tolist()
 
     @staticmethod
     def save_palette(palette, path: str, format: str = "byte", overwrite: bool = False):
@@ -210,28 +398,28 @@ class Glasbey:
         if not overwrite:
             assert not os.path.isfile(path)
 
-        with open(path, 'w') as file:
+        if format.lower() not in ("byte", "hex", "float"):
+            raise ValueError("Format doesn't match. Choose between 'byte', 'hex', and 'float'")
+
+        palette = np.asarray(palette)
+        if format.lower() == "float":
+            np.savetxt(path, np.abs(palette), fmt="%.6f", delimiter=",")
+        else:
+            rgb255 = np.clip(np.rint(palette * 255), 0, 255).astype(np.uint8)
             if format.lower() == "byte":
-                for color in palette:
-                    rgb255 = tuple(int(round(k * 255)) for k in color)
-                    file.write("{},{},{}\n".format(*rgb255))
-            elif format.lower() == "float":
-                for color in palette:
-                    file.write("{:.6f},{:.6f},{:.6f}\n".format(*(abs(k) for k in color)))
-            elif format.lower() == "hex":
-                for color in palette:
-                    rgb255 = tuple(int(round(k * 255)) for k in color)
-                    file.write("#{:02x}{:02x}{:02x}\n".format(*rgb255))
+                np.savetxt(path, rgb255, fmt="%d", delimiter=",")
             else:
-                raise ValueError("Format doesn't match. Choose between 'byte', 'hex', and 'float'")
+                with open(path, 'w') as file:
+                    file.writelines(
+                        "#{:02x}{:02x}{:02x}\n".format(*rgb) for rgb in rgb255.tolist()
+                    )
 
     def check_validity_internal_palette(self):
-        if type(self.palette) != list:
-            return False
-        for color in self.palette:
-            if len(color) != 3 or type(color) != np.ndarray:
-                return False
-        return True
+        return (
+            type(self.palette) == np.ndarray
+            and self.palette.ndim == 2
+            and self.palette.shape[1] == 3
+        )
 
     @staticmethod
     def check_validity_rbg_palette(palette):
@@ -250,7 +438,8 @@ class Glasbey:
         """
         Convert palette from sRGB1 to sRGB255.
         """
-        return [tuple(int(round(k * 255)) for k in color) for color in palette]
+        rgb255 = np.rint(np.asarray(palette) * 255).astype(int)
+        return [tuple(color) for color in rgb255.tolist()]
 
     @staticmethod
     def view_palette(palette):
@@ -276,7 +465,7 @@ if __name__ == "__main__":
     this table is a time-consuming process, therefore the first run of this
     script will take some time. The generated table will be stored in the
     working directory of the script and automatically used in next invocations
-    of the script. Note that the approximate size of the table is 363 Mb.
+    of the script. Note that the approximate size of the table is 96 Mb.
 
     The palette generation method allows the user to supply a base palette. The
     output palette will begin with the colors from the supplied set. If no base
@@ -306,17 +495,21 @@ if __name__ == "__main__":
     parser.add_argument(
         "--no-black", action="store_true", help="avoid black and similar colors"
     )
+    parser.add_argument(
+        "--boundary-only", action="store_true",
+        help="consider only colors on the RGB gamut surface (much faster)"
+    )
     parser.add_argument(
         "--lightness-range",
-        type=ast.literal_eval,
+        type=_parse_range,
         help="set min and max for lightness (e.g. 0,90)",
     )
     parser.add_argument(
         "--chroma-range",
-        type=ast.literal_eval,
+        type=_parse_range,
         help="set min and max for chroma (e.g. 10,100)",
     )
-    parser.add_argument("--hue-range", type=ast.literal_eval,
+    parser.add_argument("--hue-range", type=_parse_range,
                         help="set start and end for hue (e.g. 315,45)")
     parser.add_argument("--view", action="store_true",
                         help="view generated palette")
@@ -336,7 +529,8 @@ if __name__ == "__main__":
                  no_black=args.no_black,
                  lightness_range=args.lightness_range,
                  chroma_range=args.chroma_range,
-                 hue_range=args.hue_range)
+                 hue_range=args.hue_range,
+                 boundary_only=args.boundary_only)
 
     new_palette = gb.generate_palette(size=args.size)
     assert len(new_palette) == args.size
@@ -1,5 +1,5 @@
 import os
-from shutil import copyfile, move
+import tempfile
 from unittest import TestCase
 from glasbey import Glasbey
 import numpy
@@ -9,17 +9,11 @@ class TestGlasbey(TestCase):
     def setUp(self) -> None:
         file_path = os.path.dirname(os.path.realpath(__file__))
         self.test_palette = file_path + "/../palettes/set1.txt"
-        self.test_palette_bkp = file_path + "/../palettes/set1.txt.bkp"
-
-        self.tearDown()
 
         assert os.path.isfile(self.test_palette)
-        assert not os.path.isfile(self.test_palette_bkp)
 
-    def tearDown(self) -> None:
-        if os.path.isfile(self.test_palette_bkp):
-            # do this in case a test failed
-            move(self.test_palette_bkp, self.test_palette)
+        # Baseline size of the fixture palette, read once per test
+        self.base_color_count = numpy.loadtxt(self.test_palette, delimiter=',').shape[0]
 
     def test_bad_input(self):
         with self.assertRaises(AssertionError):
@@ -37,16 +31,18 @@ class TestGlasbey(TestCase):
         palette = gb.generate_palette(size=1)
         gb.save_palette(palette=palette, path="/tmp/random_glasbey_test_file.remove_me", format="byte", overwrite=True)
 
-        self.assertEqual(['228,26,28\n'], open('/tmp/random_glasbey_test_file.remove_me', 'r').readlines())
+        with open('/tmp/random_glasbey_test_file.remove_me', 'r') as file:
+            self.assertEqual(['228,26,28\n'], file.readlines())
 
     def test_extend_base_palette(self):
-        self.assertEqual(9, len(open(self.test_palette, 'r').readlines()))  # sanity check
+        self.assertEqual(9, self.base_color_count)  # sanity check
 
         gb = Glasbey(base_palette=self.test_palette)
         palette = gb.generate_palette(size=10)
 
         self.assertEqual(10, len(palette))
-        self.assertEqual(9, len(open(self.test_palette, 'r').readlines()))  # ensure there was no override
+        # Ensure there was no override
+        self.assertEqual(self.base_color_count, numpy.loadtxt(self.test_palette, delimiter=',').shape[0])
 
     def test_multiple_sequential_requests(self):
         gb = Glasbey(base_palette=self.test_palette)
@@ -63,16 +59,31 @@ class TestGlasbey(TestCase):
         palette = gb.generate_palette(size=18)
         self.assertEqual(18, len(palette))
 
-    def test_overwrite_base_palette(self):
-        copyfile(self.test_palette, self.test_palette_bkp)
-        self.assertEqual(9, len(open(self.test_palette, 'r').readlines()))  # sanity check
+    def test_get_palettes(self):
+        gb = Glasbey(base_palette=self.test_palette)
 
-        gb = Glasbey(base_palette=self.test_palette, overwrite_base_palette=True)
-        palette = gb.generate_palette(size=10)
+        palettes = gb.get_palettes(sizes=[5, 15, 10])
 
-        self.assertEqual(10, len(open(self.test_palette, 'r').readlines()))
+        self.assertEqual({5, 10, 15}, set(palettes.keys()))
+        for size, palette in palettes.items():
+            self.assertEqual(size, len(palette))
+        numpy.testing.assert_array_equal(palettes[5], palettes[15][:5])
 
-        move(self.test_palette_bkp, self.test_palette)
+    def test_overwrite_base_palette(self):
+        self.assertEqual(9, self.base_color_count)  # sanity check
+
+        # Run the overwrite against a throwaway copy so the fixture palette in
+        # the repository is never touched
+        with open(self.test_palette, 'r') as src, tempfile.NamedTemporaryFile(
+                mode='w', suffix='.txt', delete=False) as dst:
+            dst.write(src.read())
+        try:
+            gb = Glasbey(base_palette=dst.name, overwrite_base_palette=True)
+            palette = gb.generate_palette(size=10)
+
+            self.assertEqual(10, numpy.loadtxt(dst.name, delimiter=',').shape[0])
+        finally:
+            os.remove(dst.name)
 
     def test_rgb_list_as_base_palette(self):
         base_palette = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
@@ -5,26 +5,39 @@ import argparse
 
 import numpy as np
 
+try:
+    from PIL import Image
+
+except ImportError:
+    Image = None
+
 
 def palette_to_image(palette):
-    from PIL import Image
+    assert Image is not None, "PIL is required to render palettes"
 
     WIDTH = 180
     HEIGHT_SEGMENT = 20
-    img = Image.new("RGB", (WIDTH, HEIGHT_SEGMENT * len(palette)), "black")
-    pixels = img.load()
-    for i, color in enumerate(palette):
-        if isinstance(color, int):
-            b = (color >> 0) % 256
-            g = (color >> 8) % 256
-            r = (color >> 16) % 256
-            color = (r, g, b)
-        elif isinstance(color, np.ndarray):
-            color = tuple(int(round(k * 255)) for k in color)
-        for x in range(WIDTH):
-            for y in range(HEIGHT_SEGMENT):
-                pixels[x, y + i * HEIGHT_SEGMENT] = color
-    return img
+    # Normalize the whole palette to a (N, 3) uint8 array in one pass instead
+    # of branching on the type of every color
+    arr = np.asarray(palette)
+    if arr.ndim == 1:
+        # Packed 24-bit integers
+        arr = arr.astype(np.uint32)
+        rgb = np.stack(
+            [(arr >> 16) & 0xFF, (arr >> 8) & 0xFF, arr & 0xFF], axis=1
+        ).astype(np.uint8)
+    elif np.issubdtype(arr.dtype, np.floating):
+        # sRGB1 components
+        rgb = np.clip(np.rint(arr * 255), 0, 255).astype(np.uint8)
+    else:
+        # sRGB255 components
+        rgb = arr.astype(np.uint8)
+    # Broadcast each color over its WIDTH x HEIGHT_SEGMENT strip; the reshape
+    # materializes the zero-stride view into one contiguous pixel buffer
+    block = np.broadcast_to(
+        rgb[:, None, None, :], (len(rgb), HEIGHT_SEGMENT, WIDTH, 3)
+    ).reshape(-1, WIDTH, 3)
+    return Image.fromarray(block, "RGB")
 
 
 if __name__ == "__main__":
@@ -39,12 +52,9 @@ if __name__ == "__main__":
     parser.add_argument("--save", type=str, help="save as a PNG file")
     args = parser.parse_args()
 
-    palette = list()
-    for line in args.palette.readlines():
-        rgb = [int(c) for c in line.strip().split(",")]
-        palette.append((rgb[0], rgb[1], rgb[2]))
+    rgb = np.loadtxt(args.palette, delimiter=",", dtype=np.uint8).reshape(-1, 3)
 
-    img = palette_to_image(palette)
+    img = palette_to_image(rgb)
     if args.save:
         img.save(args.save)
     else: